@@ -9,6 +9,12 @@ from PIL import Image
 import numpy as np
 import sys
 
+try:
+    from numba import njit, prange
+    has_numba = True
+except ImportError:
+    has_numba = False
+
 
 # In[ ]:
 
@@ -29,48 +35,161 @@ def error(msg):
 def addAlphaChannel(ar):
     if ar.shape[2] != 3:
         error(f"*** Unsupported image type (this image has {nbchannels} color channels when it should be 3 or 4) ***")
-    B = np.full((ar.shape[0], ar.shape[1] ,1),255)
-    ar = np.concatenate((ar,B),axis=2)
+    out = np.empty((ar.shape[0], ar.shape[1], 4), dtype=ar.dtype)
+    out[..., :3] = ar
+    out[..., 3] = 255
+    return out
+
+# Return the minimum value of the (contiguous) alpha plane
+def minAlpha(alpha_plane):
+    return int(alpha_plane.min())
+
+if has_numba:
+    # SWAR premultiply on packed RGBA pixels: split the channels in two
+    # 16-bit pairs so a single 32-bit multiply handles two channels at once,
+    # with exact rounding of c*a/255.
+    @njit(parallel=True, cache=True)
+    def _premultiply_u32(c):
+        for i in prange(c.shape[0]):
+            for j in range(c.shape[1]):
+                color = c[i, j]
+                alfa = color >> 24
+                rb = color & 0x00ff00ff
+                rb *= alfa
+                rb += 0x00800080
+                rb += (rb >> 8) & 0x00ff00ff
+                rb &= 0xff00ff00
+                ga = (color >> 8) & 0x00ff00ff
+                ga *= alfa
+                ga += 0x00800080
+                ga += (ga >> 8) & 0x00ff00ff
+                ga &= 0xff00ff00
+                c[i, j] = (color & 0xff000000) | (ga & 0x0000ff00) | (rb >> 8)
+
+# premultiply a packed uint8 RGBA image (or a view of one), two multiplies per pixel
+def premultiply_fast(ar):
+    c = ar.view(np.uint32)[:, :, 0]
+    _premultiply_u32(c)
     return ar
 
-# Return the minimum alpha value of all pixels in the image
-def minAlpha(ar):
-    ma = 255
-    for i,j in np.ndindex(ar.shape[0:2]):
-        ma = min(ar[i,j,3], ma)
-    return ma
-
 # convert the image array from plain alpha to premultiply alpha
 # the image must have 4 channels
 def premultiply(ar):
-    print("Converting to pre-multiplied alpha format.")
-    for i,j in np.ndindex(ar.shape[0:2]):
-        alpha = float(ar[i,j,3]) / 255.0      
-        ar[i,j] = [int(ar[i,j,0]*alpha) ,int(ar[i,j,1]*alpha), int(ar[i,j,2]*alpha),ar[i,j,3]]
+    if ar.dtype == np.uint8:
+        if has_numba:
+            return premultiply_fast(ar)
+        # integer premultiply through a uint16 intermediate: 4x less bandwidth
+        # than a float64 temp, with the same exact round(c*a/255) as the SWAR kernel
+        t = ar[:, :, :3].astype(np.uint16)
+        t *= ar[:, :, 3:4]
+        t += 128
+        t += t >> 8
+        ar[:, :, :3] = (t >> 8).astype(np.uint8)
+        return ar
+    alpha = ar[:, :, 3:4].astype(np.float32) * (1.0/255.0)
+    ar[:, :, :3] = (ar[:, :, :3] * alpha).astype(ar.dtype)
     return ar
 
 # convert the first 3 channels to 5/6/5 bits
 def convertRGB565(ar):
-    for i,j in np.ndindex(ar.shape[0:2]):
-        R = int((ar[i,j,0] + 4)*31.0/255.0)
-        G = int((ar[i,j,1] + 2)*63.0/255.0)
-        B = int((ar[i,j,2] + 4)*31.0/255.0)
-        ar[i,j] = [R,G, B , ar[i,j,3]]
+    rgb = ar[..., :3].astype(np.uint16) # widen: the +4/*31 arithmetic overflows uint8
+    ar[..., 0] = ((rgb[..., 0] + 4) * 31) // 255
+    ar[..., 1] = ((rgb[..., 1] + 2) * 63) // 255
+    ar[..., 2] = ((rgb[..., 2] + 4) * 31) // 255
     return ar
         
 # Set a given color to all images with transparency strictly below a given threshold
 # alpha_threshold in [1,255]
 # rgb_transparent the transparent color to use
 def setTransparentColor(alpha_threshold , rgb_transparent, alt, ar):
+    rgb = ar[..., :3]
+    if (ar.dtype == np.uint8) and (ar.shape[2] == 4):
+        # fold the 3-channel compare into a single 32-bit compare per pixel
+        packed = ar.view(np.uint32)[..., 0] & 0x00FFFFFF
+        tc_packed = rgb_transparent[0] | (rgb_transparent[1] << 8) | (rgb_transparent[2] << 16)
+        mask_tc = (packed == tc_packed)
+    else:
+        mask_tc = (rgb == np.array(rgb_transparent)).all(axis=2)
+    rgb[mask_tc] = alt
+    # extract the strided alpha slice once so the compare streams unit-stride memory
+    mask_a = np.ascontiguousarray(ar[..., 3]) < alpha_threshold
+    rgb[mask_a] = rgb_transparent
+    return ar , int(mask_a.sum())
+
+
+if has_numba:
+    # fused pipeline: premultiply + RGB565 quantization + transparent color
+    # replacement in a single parallel sweep over the image (one pass over
+    # memory, rows distributed over all cores)
+    @njit(parallel=True, cache=True)
+    def _transform_pixels(ar, do_premul, to_rgb565, alpha_threshold, tc0, tc1, tc2, alt0, alt1, alt2):
+        m = 0
+        for i in prange(ar.shape[0]):
+            for j in range(ar.shape[1]):
+                r = int(ar[i, j, 0])
+                g = int(ar[i, j, 1])
+                b = int(ar[i, j, 2])
+                a = int(ar[i, j, 3])
+                if do_premul:
+                    # exact round(c*a/255), same as the SWAR kernel
+                    t = r*a + 128; r = (t + (t >> 8)) >> 8
+                    t = g*a + 128; g = (t + (t >> 8)) >> 8
+                    t = b*a + 128; b = (t + (t >> 8)) >> 8
+                if to_rgb565:
+                    r = ((r + 4)*31)//255
+                    g = ((g + 2)*63)//255
+                    b = ((b + 4)*31)//255
+                if alpha_threshold > 0:
+                    if (r == tc0) and (g == tc1) and (b == tc2):
+                        r = alt0; g = alt1; b = alt2
+                    if a < alpha_threshold:
+                        r = tc0; g = tc1; b = tc2
+                        m += 1
+                ar[i, j, 0] = r
+                ar[i, j, 1] = g
+                ar[i, j, 2] = b
+        return m
+
+# fused premultiply + 5/6/5 quantization through a single float32 temp:
+# one read and one write of the RGB plane instead of two of each
+def _premul_and_565(ar):
+    tmp = ar[..., :3].astype(np.float32) * (ar[..., 3:4].astype(np.float32) * (1.0/255.0))
+    ar[..., 0] = ((tmp[..., 0] + 4) * (31.0/255.0)).astype(ar.dtype)
+    ar[..., 1] = ((tmp[..., 1] + 2) * (63.0/255.0)).astype(ar.dtype)
+    ar[..., 2] = ((tmp[..., 2] + 4) * (31.0/255.0)).astype(ar.dtype)
+    return ar
+
+# tile edge: the 4 channels of a 64x64 tile stay resident in L2 between passes
+TILE_SIZE = 64
+
+# run the selected transforms on one tile (a view into the image) while it is cache-hot
+def process_tile(tile, do_premul, to_rgb565, alpha_threshold, rgb_transparent, alt):
+    if do_premul and to_rgb565:
+        _premul_and_565(tile)
+    elif do_premul:
+        premultiply(tile)
+    elif to_rgb565:
+        convertRGB565(tile)
+    if alpha_threshold > 0:
+        _ , m = setTransparentColor(alpha_threshold, rgb_transparent, alt, tile)
+        return m
+    return 0
+
+# apply the whole premultiply/RGB565/transparent-color pipeline in a single
+# cache-blocked sweep over the image instead of one full pass per transform
+def processImage(ar, do_premul, to_rgb565, alpha_threshold, rgb_transparent, alt):
+    if has_numba:
+        m = _transform_pixels(ar, do_premul, to_rgb565, alpha_threshold,
+                              rgb_transparent[0], rgb_transparent[1], rgb_transparent[2],
+                              alt[0], alt[1], alt[2])
+        return ar , m
     m = 0
-    for i,j in np.ndindex(ar.shape[0:2]):        
-        if tuple(ar[i,j,0:3]) == tuple(rgb_transparent):
-            ar[i,j,0:3] = alt        
-        if ar[i,j,3] < alpha_threshold:
-            ar[i,j,0:3] = rgb_transparent
-            m += 1        
+    for i in range(0, ar.shape[0], TILE_SIZE):
+        for j in range(0, ar.shape[1], TILE_SIZE):
+            m += process_tile(ar[i:i+TILE_SIZE, j:j+TILE_SIZE],
+                              do_premul, to_rgb565, alpha_threshold, rgb_transparent, alt)
     return ar , m
-        
+
 
 
 # In[ ]:
@@ -88,56 +207,38 @@ def RGB32(col):
 def RGBf(col):
     return f"C({float(col[0])/255.0}f,{float(col[1])/255.0}f,{float(col[2])/255.0}f)"
 
-def color(col , color_type):
-    if color_type == "RGB565":
-        return RGB565(col);
-    elif  color_type == "RGB24":
-        return RGB24(col);
-    elif  color_type == "RGB32":
-        return RGB32(col);
-    elif  color_type == "RGBf":
-        return RGBf(col);
-    else:
-        raise(f"Error, unsupported color type [type]")
-        
-def colorTypeSize(color_type):
-    if color_type == "RGB565":
-        return 2;
-    elif color_type == "RGB24":
-        return 3;
-    elif color_type == "RGB32":
-        return 4;
-    elif color_type == "RGBf":
-        return 12;
-    else:
-        raise(f"Error, unsupported color type [type]")
-
-def defineC(color_type):
-    if color_type == "RGB565":
-        return "C(R,G,B) tgx::RGB565(R,G,B)";
-    elif color_type == "RGB24":
-        return "C(R,G,B) tgx::RGB24(R,G,B)";
-    elif color_type == "RGB32":
-        return "C(R,G,B,A) tgx::RGB32(R,G,B,A)";
-    elif color_type == "RGBf":
-        return "C(R,G,B) tgx::RGBf(R,G,B)";
-    else:
-        raise(f"Error, unsupported color type [type]")
-    
-        
+# channel-value -> string lookup table: formatting a pixel becomes table
+# indexing + string concat instead of one f-string call per pixel
+_STR = np.array([str(i) for i in range(256)], dtype=object)
+
+# format all pixels at once (row-major order), vectorized for the integer color types
+def formatPixels(ar, color_type):
+    px = ar.reshape(-1, ar.shape[2])
+    if color_type == "RGBf":
+        return [RGBf(p) for p in px]
+    s = "C(" + _STR[px[:, 0]] + "," + _STR[px[:, 1]] + "," + _STR[px[:, 2]]
+    if color_type == "RGB32":
+        s = s + "," + _STR[px[:, 3]]
+    return list(s + ")")
+
+# everything type-dependent in one table: storage size, the C() macro
+# definition for the generated files, and the per-pixel formatter
+TYPES = {
+    "RGB565": dict(size=2,  define="C(R,G,B) tgx::RGB565(R,G,B)",    fmt=RGB565),
+    "RGB24":  dict(size=3,  define="C(R,G,B) tgx::RGB24(R,G,B)",     fmt=RGB24),
+    "RGB32":  dict(size=4,  define="C(R,G,B,A) tgx::RGB32(R,G,B,A)", fmt=RGB32),
+    "RGBf":   dict(size=12, define="C(R,G,B) tgx::RGBf(R,G,B)",      fmt=RGBf),
+}
+
 def colorName(color_type):
     color_type = color_type.lower()
-    if (color_type == "rgb565") or (color_type.lower() == "rgb16"):
-        return "RGB565";
-    elif  color_type == "rgb24":
-        return "RGB24";
-    elif  color_type == "rgb32":
-        return "RGB32";
-    elif  color_type == "rgbf":
-        return "RGBf";
-    else:
-        return ""
-        
+    if color_type == "rgb16":
+        return "RGB565"
+    for name in TYPES:
+        if color_type == name.lower():
+            return name
+    return ""
+
 
 
 # In[ ]:
@@ -145,30 +246,38 @@ def colorName(color_type):
 
 def createCPP(ar, color_type, name, tc):
     
-    width = ar.shape[0]
-    height = ar.shape[1]
-    color_size  = colorTypeSize(color_type)
+    height = ar.shape[0]
+    width = ar.shape[1]
+    color_size  = TYPES[color_type]["size"]
     
-    with open(name + ".cpp", "w") as f:           
+    with open(name + ".cpp", "w", buffering=1<<20) as f:
         f.write('//\n');
         f.write(f'// Image: {name}\n');
         f.write(f'// dimension: {width}x{height}\n');
         f.write(f'// Size: {int(round(width*height*color_size / 1024))}kb\n');        
         f.write(f'//\n\n');
         f.write(f'#include "{name}.h"\n\n');
-        f.write(f'#define {defineC(color_type)}\n\n');
+        f.write(f'#define {TYPES[color_type]["define"]}\n\n');
         f.write(f'// image data\n');
         f.write(f'static const tgx::{color_type} {name}_data[{width}*{height}] PROGMEM = {{\n');
-        i = 0
-        for y in range(height):
-            for x in range(width):
-                f.write(color(ar[x, y], color_type))
-                if y*x != ((width-1)*(height-1)):
-                    f.write(", ")
-                i += 1
-                if i == 16:
-                    f.write("\n")
-                    i = 0;
+        if color_type == "RGB565":
+            # channels are already 5/6/5: pack each pixel into its native
+            # uint16 value and let np.savetxt emit the whole array as hex
+            # (RGB565 has a constexpr ctor from uint16_t)
+            px = ar.reshape(-1, ar.shape[2]).astype(np.uint16)
+            packed = (px[:, 0] << 11) | (px[:, 1] << 5) | px[:, 2]
+            k = (packed.size // 16) * 16
+            if k > 0:
+                np.savetxt(f, packed[:k].reshape(-1, 16), fmt="0x%04x", delimiter=", ", newline=",\n")
+            if k < packed.size:
+                f.write(", ".join("0x%04x" % v for v in packed[k:]) + ",\n")
+        else:
+            # format all pixels first, then write 16 per line in a single pass
+            # (a trailing comma is legal in a C initializer list)
+            parts = formatPixels(ar, color_type)
+            for k in range(0, len(parts), 16):
+                f.write(", ".join(parts[k:k+16]))
+                f.write(",\n")
         f.write('};\n\n')
         f.write(f'// image object\n');        
         f.write(f'const tgx::Image<tgx::{color_type}> {name}({name}_data, {width}, {height});\n\n');             
@@ -208,43 +317,42 @@ while True:
     except:
         print(f"\n*** cannot open image file [{filename}]... ***\n\n")
 
-arim = np.asarray(image,dtype=np.int)        
-if len(arim.shape) != 3:
+# wrap PIL's pixel buffer directly: one allocation + one memcpy, guaranteed uint8
+# (the bytearray round-trip makes the array writable)
+arim = np.frombuffer(bytearray(image.tobytes()), dtype=np.uint8)
+try:
+    arim = arim.reshape(image.height, image.width, len(image.mode))
+except ValueError:
     error("Unsupported image type !")
 
-arim = np.copy(arim.transpose((1, 0, 2))) # reorder width/height
-width = arim.shape[0]
-height = arim.shape[1]
-nbchannels = arim.shape[2]
+height , width , nbchannels = arim.shape # keep PIL's row-major layout
 print(f"\nImage size : {width}x{height} with {nbchannels} color channels\n")
 
 # deal with transparency in the source image
+do_premul = False
 if nbchannels == 4:
-    minalpha = minAlpha(arim)
+    minalpha = minAlpha(np.ascontiguousarray(arim[..., 3]))
     if (minalpha == 255):
         print("- this image has an alpha channel but all pixels are fully opaque.\n")
-    else:   
+    else:
         print("- this image uses transparency.\n")
         ans = input("Do you want to convert colors to pre-multiplied alpha (Y/n)?")
         if not (ans.lower() =='n'):
-            arim = premultiply(arim)
+            do_premul = True
 else:
     arim = addAlphaChannel(arim)
     minalpha = 255
-    
+
 # Choose output color type
-while True:    
+while True:
     color_type = input("\nChoose the image color type: RGB565, RGB24, RGB32 or RGBf ? ")
     color_type = colorName(color_type)
     if (color_type != ""):
         break
 
-# change color value range when using 5/6/5 bits images
-if (color_type == "RGB565"):
-    arim  = convertRGB565(arim)        
-     
 # choose transparent color (if needed)
 use_tc = False
+alpha_threshold = 0
 tc = [1,1,1]# transparent color
 alt_tc = [1,0,1] # alternate color for pixel with inital color tc
 
@@ -256,8 +364,13 @@ if (minalpha < 255):
             alpha_threshold = int(input("- alpha threshold (in [1,255]) ? "))
             print(f"- color (R={tc[0]},G={tc[1]},B={tc[2]}) is chosen as the transparent color")
             print(f"  and replaces all pixels with alpha < {alpha_threshold}...")
-            arim , m = setTransparentColor(alpha_threshold, tc, alt_tc, arim)
-            print(f"  Found {m} transparent pixels.")
+
+# apply all requested transforms in one tiled sweep over the image
+if do_premul:
+    print("Converting to pre-multiplied alpha format.")
+arim , m = processImage(arim, do_premul, color_type == "RGB565", alpha_threshold, tc, alt_tc)
+if use_tc:
+    print(f"  Found {m} transparent pixels.")
 
 filename = input("Name of the image ? ")
 createCPP(arim, color_type, filename, tc if use_tc else None)
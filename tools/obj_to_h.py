@@ -5,9 +5,15 @@
 
 
 import sys
-from collections import defaultdict
-import math
+import io
 import re
+import numpy as np
+
+try:
+    from numba import njit
+    has_numba = True
+except ImportError:
+    has_numba = False
 
 
 # In[ ]:
@@ -25,105 +31,29 @@ def error(msg):
 
 
 def invertEdge(E):
-    return (E[1], E[0])
-
-
-# In[ ]:
-
-
-# return the edge after E in the triangle T
-def edgeAfter(T , E):    
-    E1 = (T[0], T[1])
-    E2 = (T[1], T[2])
-    E3 = (T[2], T[0])
-    if E == E1:
-        return E2
-    if E == E2:
-        return E3
-    if E == E3:
-        return E1
-    error(f"error in edgeAfter({T} , {E}), edge not found")
-
-
-# In[ ]:
-
-
-# return edge number i in the triangle
-def edge(T, i):
-    return (T[0], T[1]) if i == 0 else ((T[1], T[2]) if i ==1 else (T[2], T[0]))
-
-
-# In[ ]:
-
-
-# rotate the triangle vertices to start with edge E
-def rotateTriangleStartEdge(T,E):
-    if (T[0],T[1]) == E:
-        return T
-    if (T[1],T[2]) == E:
-        return (T[1], T[2], T[0])
-    if (T[2],T[0]) == E:
-        return (T[2], T[0], T[1])
-    error(f"error in rotateTriangleStartEdge({T} , {E}), edge not found")    
+    # edges are packed as (a << 32) | b so swapping endpoints is a bit swap,
+    # cheaper to build and hash than a tuple of corners
+    return ((E & 0xFFFFFFFF) << 32) | (E >> 32)
 
 
 # In[ ]:
 
 
 def splitFace(face):
-    if (len(face) == 3):        
-        return [tuple(face)]
-    return [tuple(face[:3])] + splitFace([face[0]] + face[2:])
-
-
-# In[ ]:
-
-
-def getint(str, linenb):
-    try:
-        v = int(str)
-        return v
-    except:
-        error(f"cannot convert [{str}] to int at line {linenb + 1}.gitignore")
-
-
-# In[ ]:
-
-
-def getfloat(str, linenb):
-    try:
-        v = float(str)
-        return v
-    except:
-        error(f"cannot convert [{str}] to int at line {linenb + 1}.gitignore")
+    # fan triangulation: iterate instead of recursing (no per-level list copies)
+    f0 = face[0]
+    return [(f0, face[i], face[i + 1]) for i in range(1, len(face) - 1)]
 
 
 # In[ ]:
 
 
-def parseFaceTag(f, lena, linenb):
-    x = f.split("/")
-    if len(x) == 0 or len(x) > 3:
-        error(f"wrong face index: {f} at line {linenb+1}")
-    if len(x) == 1:
-        x += ['', '']
-    if len(x) == 2:
-        x += ['']            
-    for i in range(3): 
-        if x[i] == '':
-            x[i] = -1
-        else:
-            v = getint(x[i], linenb)        
-            if (v == 0):
-                error(f"wrong face index: {f} at line {linenb+1} (index 0)")
-            x[i] = (v - 1) if v > 0 else lena[i] + v                       
-    return tuple(x)
-
-
-# In[ ]:
+# one compiled pattern parses a whole v/vt/vn face tag, replacing a
+# per-slash split + int() conversion loop per corner
+_facetag = re.compile(rb'(-?\d+)(?:/(-?\d*)(?:/(-?\d*))?)?')
 
 
-def loadObjFile(filename):    
+def loadObjFile(filename):
     """
     Load the .obj file
     """
@@ -133,93 +63,137 @@ def loadObjFile(filename):
     normal = []
     obj = []
     tag = []
-    
+
     currentobj = []
     currentname = ""
     currenttagline = 0
-    currentnb = 0
-    
+
     print(f"Reading file {filename}.\n")
     try:
-        with open(filename, "r") as f:
-            lines = list(f)
+        with open(filename, "rb") as f:
+            lines = f.read().splitlines()
     except:
         error(f"Cannot open file [{filename}]")
-        
-    for linenb , line in enumerate(lines): 
-        l = line.split()
+
+    # v/vt/vn lines are only buffered during the pass and bulk-converted to
+    # float at the end in a single numpy call: number parsing dominates the
+    # load time of vertex-heavy files. Only the entry counts are needed
+    # during the pass (to resolve negative face indexes), so they are
+    # tracked separately in nbv.
+    vbuf, tbuf, nbuf = [], [], []
+    nbv = [0, 0, 0]
+
+    def _parse_v(line, linenb):
+        vbuf.append((line, linenb))
+        nbv[0] += 1
+
+    def _parse_vt(line, linenb):
+        tbuf.append((line, linenb))
+        nbv[1] += 1
+
+    def _parse_vn(line, linenb):
+        nbuf.append((line, linenb))
+        nbv[2] += 1
+
+    def _parse_f(line, linenb):
+        nonlocal currentobj
+        lena = tuple(nbv)
+        face = []
+        for m in _facetag.finditer(line):
+            c = []
+            for i in range(3):
+                g = m.group(i + 1)
+                if (g is None) or (g == b''):
+                    c.append(-1)
+                else:
+                    v = int(g)
+                    if (v == 0):
+                        error(f"wrong face index: {m.group(0)} at line {linenb+1} (index 0)")
+                    c.append((v - 1) if v > 0 else lena[i] + v)
+            face.append(tuple(c))
+        currentobj += splitFace(face)
+
+    def _parse_tag(line, linenb):
+        nonlocal currentobj, currentname, currenttagline
+        l = [t.decode() for t in line.split()]
+        if len(currentobj) > 0:
+            print(f"--- found object {len(obj)+1} starting from tag [{currentname}] at line {currenttagline+1} with {len(currentobj)} triangles.")
+            obj.append(currentobj)
+            tag.append(currentname)
+            currentobj = []
+            currentname = "" if len(l) == 1 else " ".join(l)
+            currenttagline = linenb
+        else:
+            currenttagline = linenb
+            if len(l) >1:
+                currentname += " | " + " ".join(l)
+
+    # dispatch on the first token (as bytes: cheaper compare, no decoding)
+    dispatch = { b'v': _parse_v, b'vt': _parse_vt, b'vn': _parse_vn, b'f': _parse_f,
+                 b'o': _parse_tag, b'g': _parse_tag, b'usemtl': _parse_tag }
+
+    for linenb , line in enumerate(lines):
+        l = line.split(None, 1)
         if len(l) == 0:
-            l = [""] # dummy value
-        if l[0] == 'v':
-            v = tuple(float(v) for v in l[1:])[:3]
-            if len(v) != 3:
-                error(f"found wrong vertex [v] (not 3 components) at line {linenb+1}")
-            vertice.append(v)
-            
-        if l[0] == "vt":
-            vt = tuple(float(t) for t in l[1:])[:2]
-            if len(vt) != 2:
-                error(f"found wrong texture coord [vt] (not 2 components) at line {linenb+1}")
-            texture.append(vt)
-           
-        if l[0] == "vn":
-            vn = tuple(float(n) for n in l[1:])[:3]
-            if len(vn) != 3:
-                error(f"found wrong normal [vn] (not 3 components) at line {linenb+1}")
-            normal.append(vn)
-            
-        if l[0] == "o" or l[0] == "g" or l[0] == "usemtl":
-            if len(currentobj) > 0:                
+            continue
+        h = dispatch.get(l[0])
+        if h is not None:
+            h(line, linenb)
+
+    if len(currentobj) > 0:
                 print(f"--- found object {len(obj)+1} starting from tag [{currentname}] at line {currenttagline+1} with {len(currentobj)} triangles.")
                 obj.append(currentobj)
                 tag.append(currentname)
-                currentobj = [] 
-                currentname = "" if len(l) == 1 else " ".join(l)
-                currenttagline = linenb
-            else:
-                currenttagline = linenb
-                if len(l) >1:
-                    currentname += " | " + " ".join(l)
-                    
-          
-        if l[0] == 'f':
-            face = [parseFaceTag(x , [len(vertice), len(texture), len(normal)], linenb) for x in l[1:]]
-            currentobj += splitFace(face)
-            
-    if len(currentobj) > 0:                
-                print(f"--- found object {len(obj)+1} starting from tag [{currentname}] at line {currenttagline+1} with {len(currentobj)} triangles.")
-                obj.append(currentobj)
-                tag.append(currentname)              
-                
+
+    # bulk float conversion of the buffered v/vt/vn payloads
+    def _bulk(buf, ncomp, what):
+        rows = []
+        for line, linenb in buf:
+            r = line.split()[1:1+ncomp]
+            if len(r) != ncomp:
+                error(f"found wrong {what} (not {ncomp} components) at line {linenb+1}")
+            rows += r
+        if len(rows) == 0:
+            return []
+        return list(map(tuple, np.array(rows, dtype=np.float64).reshape(-1, ncomp).tolist()))
+
+    vertice[:] = _bulk(vbuf, 3, "vertex [v]")
+    texture[:] = _bulk(tbuf, 2, "texture coord [vt]")
+    normal[:] = _bulk(nbuf, 3, "normal [vn]")
+
     if (len(obj) == 0):
         error("no faces found in the file !")
 
-    setvi = set()
-    setti = set()
-    setni = set() 
-    for o in obj:
-        for T in o:
-            for (v,t,n) in T:
-                
-                if v < 0:
-                    error(f"negative vertex index {v} found in face {T}")
-                if v >= len(vertice):
-                    error(f"vertex index out of bound {v}/{len(vertice)} in face {T}")   
-                setvi.add(v)
-                
-                if (t < -1) or (t >= len(texture)):
-                    error(f"texture index out of bound {v}/{len(texture)} in face {T}")  
-                setti.add(t)
-                
-                if (n < -1) or (n >= len(normal)):
-                    error(f"normal index out of bound {v}/{len(normal)} in face {T}")  
-                setni.add(n)       
-           
-    if len(setti) > 1 and -1 in setti:
-        error(f"Missing texture indexes for some faces (but not all).")  
-
-    if len(setni) > 1 and -1 in setni:
-        error(f"Missing normal indexes for some faces (but not all).")  
+    # stack every face in a single (nfaces,3,3) index array and run the
+    # validity checks vectorized instead of three nested Python loops
+    faces = [T for o in obj for T in o]
+    A = np.array(faces, dtype=np.int64)
+    vi = A[:, :, 0]
+    ti = A[:, :, 1]
+    ni = A[:, :, 2]
+
+    def firstbad(plane, mask):
+        i, j = np.argwhere(mask)[0]
+        return plane[i, j], faces[i]
+
+    if (vi < 0).any():
+        v, T = firstbad(vi, vi < 0)
+        error(f"negative vertex index {v} found in face {T}")
+    if (vi >= len(vertice)).any():
+        v, T = firstbad(vi, vi >= len(vertice))
+        error(f"vertex index out of bound {v}/{len(vertice)} in face {T}")
+    if ((ti < -1) | (ti >= len(texture))).any():
+        v, T = firstbad(vi, (ti < -1) | (ti >= len(texture)))
+        error(f"texture index out of bound {v}/{len(texture)} in face {T}")
+    if ((ni < -1) | (ni >= len(normal))).any():
+        v, T = firstbad(vi, (ni < -1) | (ni >= len(normal)))
+        error(f"normal index out of bound {v}/{len(normal)} in face {T}")
+
+    if (ti >= 0).any() and (ti < 0).any():
+        error(f"Missing texture indexes for some faces (but not all).")
+
+    if (ni >= 0).any() and (ni < 0).any():
+        error(f"Missing normal indexes for some faces (but not all).")
             
     print(f"\nTOTAL :")
     print(f"- {len(vertice)} vertices [v]")        
@@ -233,16 +207,10 @@ def loadObjFile(filename):
 
 
 def findBoundingBox(vertice):
-    xmin , ymin, zmin  = vertice[0]
-    xmax , ymax, zmax  = vertice[0]
-    for (x,y,z) in vertice:
-        xmin = min(xmin,x)
-        xmax = max(xmax,x)
-        ymin = min(ymin,y)
-        ymax = max(ymax,y)
-        zmin = min(zmin,z)
-        zmax = max(zmax,z)        
-    return xmin,xmax,ymin,ymax,zmin,zmax
+    a = np.asarray(vertice, dtype=np.float64)
+    mn = a.min(0)
+    mx = a.max(0)
+    return mn[0],mx[0],mn[1],mx[1],mn[2],mx[2]
 
 def recenterAndRescale(vertice):
     pr = 2
@@ -250,17 +218,11 @@ def recenterAndRescale(vertice):
     print(f"\nBounding box of the model [{round(xmin,pr)},{round(xmax,pr)}]x[{round(ymin,pr)},{round(ymax,pr)}]x[{round(zmin,pr)},{round(zmax,pr)}]\n")
     ans = input("Do you want to translate/resize the model to fit in [-1,1]x[-1,1]*[-1,1] (y/N) ?")
     if len(ans) > 0 and (ans.lower())[0] == "y":        
-        cx = (xmin + xmax)/2
-        cy = (ymin + ymax)/2
-        cz = (zmin + zmax)/2
-        mx = (xmax -xmin)/2
-        my = (ymax -ymin)/2
-        mz = (zmax -zmin)/2
-        s = max(mx,my,mz)
-        for i in range(len(vertice)):            
-            x,y,z  = vertice[i]
-            vertice[i] = ((x - cx)/s , (y-cy)/s, (z-cz)/s)                    
-        xmin,xmax,ymin,ymax,zmin,zmax = findBoundingBox(vertice)        
+        center = np.array([xmin + xmax, ymin + ymax, zmin + zmax]) / 2
+        s = max((xmax -xmin)/2, (ymax -ymin)/2, (zmax -zmin)/2)
+        V = (np.asarray(vertice, dtype=np.float64) - center) / s
+        vertice[:] = [tuple(v) for v in V]
+        xmin,xmax,ymin,ymax,zmin,zmax = findBoundingBox(V)
     xmin = round(xmin,pr)
     xmax = round(xmax,pr)
     ymin = round(ymin,pr)
@@ -275,23 +237,14 @@ def recenterAndRescale(vertice):
 # In[ ]:
 
 
-def dist(A, B):
-    return math.sqrt((A[0]-B[0])*(A[0]-B[0]) + (A[1]-B[1])*(A[1]-B[1]) + (A[2]-B[2])*(A[2]-B[2]))
-
-
-# In[ ]:
-
-
 def boundingBoxes(vertice, R):
+    V = np.asarray(vertice, dtype=np.float64)
     res = []
     for O in R:
-        #iterate over the objects
-        vert = []
-        for C in O:
-            for _,T in C:
-                for u, _, _ in T:
-                    vert.append(vertice[u])  
-        xmin,xmax,ymin,ymax,zmin,zmax = findBoundingBox(vert)
+        # gather the vertex indexes of the object, then reduce in one pass
+        idx = np.fromiter((u for C in O for _,T in C for u,_,_ in T), dtype=np.int64)
+        xmin,ymin,zmin = V[idx].min(0)
+        xmax,ymax,zmax = V[idx].max(0)
         res.append((xmin,xmax,ymin,ymax,zmin,zmax))
     return res
 
@@ -299,148 +252,361 @@ def boundingBoxes(vertice, R):
 # In[ ]:
 
 
-def addVec(VA,VB):
-    return (VA[0]+VB[0], VA[1]+VB[1], VA[2]+VB[2])
-
-def normVec(V):
-    norm = math.sqrt(V[0]*V[0] + V[1]*V[1] + V[2]*V[2])
-    return V if (norm == 0) else (V[0]/norm, V[1]/norm, V[2]/norm)
-
-def crossProduct(VA,VB):
-    return ( VA[1]*VB[2] -  VA[2]*VB[1], VA[2]*VB[0] -  VA[0]*VB[2], VA[0]*VB[1] -  VA[1]*VB[0])
-
-def Vec(VA, VB):
-    return (VB[0] - VA[0], VB[1] - VA[1], VB[2] - VA[2])
-
-
-# In[ ]:
-
-
 def fixNormals(vertice, normal, obj):
     # normal = []  # uncomment for forcing normal regeneration
-    if len(normal) == 0:        
+    if len(normal) == 0:
         print("\nNo normal found in .obj file.", end="")
-        ans = input("Do you want to compute smooth normals (y/n) ?")       
-        if len(ans) > 0 and ((ans.lower())[0] == "y" or (ans.lower())[0] == "o"):        
-            # create the normals
-            normal = [(0.0, 0.0, 0.0)] * len(vertice)            
+        ans = input("Do you want to compute smooth normals (y/n) ?")
+        if len(ans) > 0 and ((ans.lower())[0] == "y" or (ans.lower())[0] == "o"):
+            # accumulate the (area-weighted) face normal of every triangle on
+            # its three vertices, all triangles at once
+            V = np.asarray(vertice, dtype=np.float64)
+            N = np.zeros_like(V)
             for o in obj:
-                for T0,T1,T2 in o:   
-                    i0 = T0[0]
-                    i1 = T1[0]
-                    i2 = T2[0]
-                    V0 = Vec(vertice[i1] , vertice[i0])
-                    V1 = Vec(vertice[i2] , vertice[i1])
-                    V2 = Vec(vertice[i0] , vertice[i2])
-                    N0 = crossProduct(V2, V0)
-                    N1 = crossProduct(V0, V1)
-                    N2 = crossProduct(V1, V2)
-                    N = addVec(addVec(N0, N1),N2);
-                    normal[i0] = addVec(normal[i0] , N)
-                    normal[i1] = addVec(normal[i1] , N)
-                    normal[i2] = addVec(normal[i2] , N)    
-                    
-            # insert normal indexes in object
+                idx = np.array([[T0[0], T1[0], T2[0]] for T0,T1,T2 in o], dtype=np.int64)
+                fn = np.cross(V[idx[:,1]] - V[idx[:,0]], V[idx[:,2]] - V[idx[:,0]])
+                np.add.at(N, idx.ravel(), np.repeat(fn, 3, axis=0))
+            normal = [tuple(n) for n in N]
+
+            # insert normal indexes in object (normal i belongs to vertex i,
+            # so copying the vertex column does it in one slice assignment)
             for o in obj:
-                for i in range(len(o)):                        
-                    T1, T2, T3 = o[i]
-                    o[i] = ((T1[0], T1[1], T1[0]),(T2[0], T2[1], T2[0]),(T3[0], T3[1], T3[0]))
-                
+                arr = np.array(o, dtype=np.int64)
+                arr[:, :, 2] = arr[:, :, 0]
+                o[:] = [tuple(map(tuple, t)) for t in arr.tolist()]
+
     # normalize the normals
-    for i in range(len(normal)):
-        normal[i] = normVec(normal[i])        
-    return normal        
+    if len(normal) > 0:
+        N = np.asarray(normal, dtype=np.float64)
+        norms = np.linalg.norm(N, axis=1, keepdims=True)
+        N /= np.where(norms == 0, 1, norms)
+        normal = [tuple(n) for n in N]
+    return normal
 
 
 # In[ ]:
 
 
+if has_numba:
+    # chain construction over pure int32/int64 arrays: same walk as the Python
+    # version below, with the edge dict replaced by a sorted-unique edge table.
+    # outputs the flat sequence (triangle, rotation, n-code) plus chain lengths.
+    @njit(cache=True)
+    def _build_chains(eid, inv_eid, nedges):
+        N = eid.shape[0]
+        edge_first = np.full(nedges, -1, np.int64)
+        edge_second = np.full(nedges, -1, np.int64)
+        for i in range(N):
+            for j in range(3):
+                e = eid[i, j]
+                if edge_first[e] < 0:
+                    edge_first[e] = i
+                else:
+                    edge_second[e] = i
+        used = np.zeros(N, np.uint8)
+        out_ti = np.empty(N, np.int64)
+        out_r = np.empty(N, np.int64)
+        out_n = np.empty(N, np.int64) # -1 marks a chain head
+        chain_len = np.empty(N, np.int64)
+        firstTavail = 0
+        nbTavail = N
+        pos = 0
+        nchains = 0
+        while nbTavail > 0:
+            # start a new chain
+            nbTavail -= 1
+            while used[firstTavail] == 1:
+                firstTavail += 1
+            ti = firstTavail
+            used[ti] = 1
+            out_ti[pos] = ti; out_r[pos] = 0; out_n[pos] = -1
+            pos += 1
+            clen = 1
+            r = 0
+            ei = 2
+            while clen < 65535:
+                ti2 = -1
+                tries = 3 if clen == 1 else 2
+                while tries > 0:
+                    ei = (ei + 1) % 3
+                    e = inv_eid[ti, ei]
+                    if e >= 0:
+                        i = edge_first[e]
+                        if (i >= 0) and (used[i] == 1):
+                            i = edge_second[e]
+                            if (i >= 0) and (used[i] == 1):
+                                i = -1
+                        if i >= 0:
+                            used[i] = 1
+                            nbTavail -= 1
+                            ti2 = i
+                            break
+                    tries -= 1
+                if ti2 < 0:
+                    break
+                k = (ei - r) % 3
+                if k == 0:
+                    if clen > 1:
+                        return out_ti, out_r, out_n, chain_len, -1 # "wrong next edge"
+                    n = 2
+                elif k == 1:
+                    n = 1
+                else:
+                    n = 0
+                e = inv_eid[ti, ei] # the shared edge, seen from ti2
+                if eid[ti2, 0] == e:
+                    r = 0
+                elif eid[ti2, 1] == e:
+                    r = 1
+                else:
+                    r = 2
+                out_ti[pos] = ti2; out_r[pos] = r; out_n[pos] = n
+                pos += 1
+                clen += 1
+                ti = ti2
+                ei = r
+            chain_len[nchains] = clen
+            nchains += 1
+        return out_ti, out_r, out_n, chain_len, nchains
+
+
+def _reorderObjectTrianglesNumba(obj):
+    # number the distinct (v,t,n) corners and encode each directed edge as
+    # (corner_a << 32) | corner_b so the kernel only sees integer arrays
+    corner_id = {}
+    tris = np.empty((len(obj), 3), dtype=np.int64)
+    for i, T in enumerate(obj):
+        for j in range(3):
+            tris[i, j] = corner_id.setdefault(T[j], len(corner_id))
+    nxt = np.roll(tris, -1, axis=1)
+    keys = (tris << 32) | nxt
+    ikeys = (nxt << 32) | tris
+    uk, eid = np.unique(keys, return_inverse=True)
+    eid = eid.reshape(keys.shape).astype(np.int64)
+    p = np.minimum(np.searchsorted(uk, ikeys), len(uk) - 1)
+    inv_eid = np.where(uk[p] == ikeys, p, -1).astype(np.int64)
+
+    out_ti, out_r, out_n, chain_len, nchains = _build_chains(eid, inv_eid, len(uk))
+    if nchains < 0:
+        error("wrong next edge...")
+
+    # rebuild the chain lists from the flat kernel output
+    R = []
+    pos = 0
+    for c in range(nchains):
+        C = []
+        for q in range(pos, pos + chain_len[c]):
+            T = obj[out_ti[q]]
+            r = out_r[q]
+            if r == 1:
+                T = (T[1], T[2], T[0])
+            elif r == 2:
+                T = (T[2], T[0], T[1])
+            n = out_n[q]
+            C.append((None if n < 0 else int(n), T))
+        pos += chain_len[c]
+        if len(C)>1:
+            if C[1][0] == 2:
+                C[0] = (None , ( C[0][1][1], C[0][1][2], C[0][1][0] ))
+                C[1] = (0, C[1][1])
+        R.append(C)
+    return R
+
+
+def forsythReorder(obj):
+    """
+    Reorder the triangles of an object with Forsyth's linear-speed vertex
+    cache optimization: triangles are picked greedily by the summed score
+    of their vertices, scored by LRU cache position plus a valence boost.
+    Consecutive triangles then reuse recently seen vertices, which improves
+    the vertex cache hit rate of the chains built from the reordered list.
+    """
+    nt = len(obj)
+    if nt < 3:
+        return obj
+
+    CACHE_SIZE = 32       # modelled LRU cache (3 extra slots for the new triangle)
+    DECAY = 1.5           # cache position score decay power
+    LAST_TRI_SCORE = 0.75 # score of the vertices of the previous triangle
+    VALENCE_SCALE = 2.0   # boost so nearly exhausted vertices get used up early
+    VALENCE_POWER = 0.5
+
+    tris = [(T[0][0], T[1][0], T[2][0]) for T in obj]
+    vtris = {} # vertex -> indexes of the (not yet used) triangles using it
+    for i, t in enumerate(tris):
+        for v in t:
+            vtris.setdefault(v, []).append(i)
+    valence = {v: len(l) for v, l in vtris.items()}
+
+    def vertexScore(pos, val):
+        if val == 0:
+            return 0.0
+        if pos < 0:
+            s = 0.0
+        elif pos < 3:
+            s = LAST_TRI_SCORE
+        else:
+            s = (1.0 - (pos - 3) / (CACHE_SIZE - 3)) ** DECAY
+        return s + VALENCE_SCALE * (val ** -VALENCE_POWER)
+
+    score = {v: vertexScore(-1, val) for v, val in valence.items()}
+    tscore = [score[a] + score[b] + score[c] for (a, b, c) in tris]
+    used = bytearray(nt)
+    cache = [] # most recently used vertex first
+    order = []
+
+    for _ in range(nt):
+        # best candidate among the triangles touching a cached vertex, with
+        # a full scan fallback when starting a new connected component
+        best = -1
+        bestscore = -1.0
+        for v in cache:
+            for i in vtris[v]:
+                if (not used[i]) and (tscore[i] > bestscore):
+                    best = i
+                    bestscore = tscore[i]
+        if best < 0:
+            for i in range(nt):
+                if (not used[i]) and (tscore[i] > bestscore):
+                    best = i
+                    bestscore = tscore[i]
+        used[best] = 1
+        order.append(best)
+
+        # LRU update: the triangle vertices move to the front of the cache
+        t = tris[best]
+        for v in t:
+            valence[v] -= 1
+            if v in cache:
+                cache.remove(v)
+        cache[0:0] = dict.fromkeys(t)
+        evicted = cache[CACHE_SIZE:]
+        del cache[CACHE_SIZE:]
+
+        # rescore the vertices whose cache position changed, then the
+        # still unused triangles using them
+        dirty = set(cache)
+        dirty.update(evicted)
+        pos = {v: p for p, v in enumerate(cache)}
+        for v in dirty:
+            score[v] = vertexScore(pos.get(v, -1), valence[v])
+        retri = set()
+        for v in dirty:
+            retri.update(vtris[v])
+        for i in retri:
+            if not used[i]:
+                a, b, c = tris[i]
+                tscore[i] = score[a] + score[b] + score[c]
+
+    return [obj[i] for i in order]
+
+
 def reorderObjectTriangles(obj):
-    availT = obj[:] # list of triangles. Set to none once used. 
-    dicedge = defaultdict(lambda: []) # mapping from edge to triangles indexes
-    firstTavail = 0 # first triangle available in availT
-    nbTavail = len(obj) # number of triangle available in availT
-    for i in range(len(obj)):                
-        dicedge[edge(obj[i],0)].append(i)
-        dicedge[edge(obj[i],1)].append(i)
-        dicedge[edge(obj[i],2)].append(i)   
-    
-    # this method return a triangle index a given edge and mark it as used
-    # or return none if no triangle available. 
+    # cache-friendly face order first: the chain builder consumes the
+    # triangles in the order given, so it directly inherits the locality
+    obj = forsythReorder(obj)
+    if has_numba:
+        return _reorderObjectTrianglesNumba(obj)
+    # number the distinct (v,t,n) corners then pack each directed edge as a
+    # single 64 bit int (edge i goes from corner i to corner i+1): int keys
+    # hash much faster than nested tuples
+    corner_id = {}
+    _cid = corner_id.setdefault
+    ids = [(_cid(T[0], len(corner_id)), _cid(T[1], len(corner_id)), _cid(T[2], len(corner_id))) for T in obj]
+    edges = [((a << 32) | b, (b << 32) | c, (c << 32) | a) for (a, b, c) in ids]
+    NEXT = (1, 2, 0) # index of the edge after edge i in a triangle
+    NCODE = (2, 1, 0) # n-code of a link whose shared edge has rotated index k
+    # each directed edge belongs to at most two triangles in a manifold mesh,
+    # so a (first, second) pair per edge replaces a list object per edge
+    edge_to_tris = {}
+    for i, E in enumerate(edges):
+        for e in E:
+            p = edge_to_tris.get(e)
+            edge_to_tris[e] = (i, -1) if p is None else (p[0], i)
+
+    used = bytearray(len(obj)) # set to 1 once the triangle has been consumed
+    firstTavail = 0 # first triangle that may still be available
+    nbTavail = len(obj) # number of triangles still available
+
+    # return the index of an available triangle with a given edge and mark it
+    # as used, or return -1 if no triangle available.
     def findTriangleWithEdge(E):
-        nonlocal availT
-        nonlocal dicedge
-        nonlocal firstTavail
         nonlocal nbTavail
-        L = dicedge[E]
-        while(len(L) > 0):
-            i = L.pop()
-            if availT[i] != None:
-                TT = availT[i]
-                availT[i] = None
-                nbTavail -= 1
-                return TT
-        return None
-
-    # return the next available triangle or none if all triangles have been used
+        p = edge_to_tris.get(E)
+        if p is None:
+            return -1
+        i = p[0]
+        if used[i]:
+            i = p[1]
+            if (i < 0) or used[i]:
+                return -1
+        used[i] = 1
+        nbTavail -= 1
+        return i
+
+    # return the index of the next available triangle or -1 if all triangles have been used
     def getNextTriangle():
-        nonlocal availT
         nonlocal firstTavail
-        nonlocal nbTavail        
+        nonlocal nbTavail
         if nbTavail == 0:
-            return None
+            return -1
         nbTavail -= 1
-        while(availT[firstTavail] == None):
-            firstTavail += 1            
-        T = availT[firstTavail]
-        availT[firstTavail] = None              
-        return T
-    R = []    
-    while True:        
-        # start a new chain 
-        T = getNextTriangle()
-        if (T == None):
-            return R        
-        C = [ (None, T) ]        
-        E = edge(T, 2) 
-        
+        while used[firstTavail]:
+            firstTavail += 1
+        used[firstTavail] = 1
+        return firstTavail
+
+    # triangle ti rotated so that its edge r comes first
+    def rotated(ti, r):
+        T = obj[ti]
+        if r == 0:
+            return T
+        if r == 1:
+            return (T[1], T[2], T[0])
+        return (T[2], T[0], T[1])
+
+    R = []
+    while True:
+        # start a new chain
+        ti = getNextTriangle()
+        if (ti < 0):
+            return R
+        C = [ (None, obj[ti]) ]
+        r = 0  # rotation of the current triangle as stored in the chain
+        ei = 2 # index (in the unrotated triangle) of the current edge
+
         while True:
             MAXCHAINLEN = 65535
-            if len(C) == MAXCHAINLEN:                
-                break                 
-            E = edgeAfter(T , E)            
-            T2 = findTriangleWithEdge(invertEdge(E))
-            if T2 == None:
-                E = edgeAfter(T , E)
-                T2 = findTriangleWithEdge(invertEdge(E))
-                if T2 == None:
-                    if len(C) > 1:                        
-                        break 
-                    else:                    
-                        E = edgeAfter(T , E)
-                        T2 = findTriangleWithEdge(invertEdge(E))
-                        if T2 == None:                            
-                            break 
-            # got the next link in T2 with shared edge E
-            pT = C[-1][1]
-            n = None
-            if (E == (pT[0], pT[1])):
-                if len(C) > 1:
-                    error("wrong next edge...")
-                n = 2
-            if (E == (pT[2], pT[0])):
-                n = 0
-            if (E == (pT[1], pT[2])):
-                n = 1
-            if n == None:
-                    error("edge not found...")        
-            E = invertEdge(E)            
-            T = T2
-            C.append((n, rotateTriangleStartEdge(T,E)))
-            
+            if len(C) == MAXCHAINLEN:
+                break
+            ei = NEXT[ei]
+            ti2 = findTriangleWithEdge(invertEdge(edges[ti][ei]))
+            if ti2 < 0:
+                ei = NEXT[ei]
+                ti2 = findTriangleWithEdge(invertEdge(edges[ti][ei]))
+                if ti2 < 0:
+                    if len(C) > 1:
+                        break
+                    else:
+                        ei = NEXT[ei]
+                        ti2 = findTriangleWithEdge(invertEdge(edges[ti][ei]))
+                        if ti2 < 0:
+                            break
+            # got the next link in ti2, sharing edge ei of triangle ti.
+            # the n-code only depends on the edge index in the rotated frame
+            # of the stored triangle: a direct lookup replaces the dispatch.
+            n = NCODE[(ei - r) % 3]
+            if (n == 2) and (len(C) > 1):
+                error("wrong next edge...")
+            E = invertEdge(edges[ti][ei])
+            r = edges[ti2].index(E) # rotation bringing the shared edge first
+            C.append((n, rotated(ti2, r)))
+            ti = ti2
+            ei = r
+
         if len(C)>1:
             if C[1][0] == 2:
-                C[0] = (None , ( C[0][1][1], C[0][1][2], C[0][1][0] )) 
+                C[0] = (None , ( C[0][1][1], C[0][1][2], C[0][1][0] ))
                 C[1] = (0, C[1][1])
         R.append(C)
 
@@ -490,37 +656,30 @@ def reorderVNTarrays(vertice, texture, normal, R):
         return vi
     
     def invperm(vi):
-        iv = vi[:]
-        for i, a in enumerate(vi):
-            iv[a] = i
+        # invert the permutation with a single scatter
+        v = np.asarray(vi, dtype=np.int64)
+        iv = np.empty_like(v)
+        iv[v] = np.arange(v.size, dtype=np.int64)
         return iv
         
-    def chI(T, index, iv):
-        if index == 0: 
-            return (iv[T[0]], T[1], T[2])
-        if index == 1:
-            return (T[0], iv[T[1]], T[2])
-        if index == 2:
-            return (T[0], T[1], iv[T[2]])
-        error("chTriangleIndex() wrong index")
-        
-    def reorderArray(vi, ar, R, index): 
+    def reorderArray(vi, ar, R, index):
         if vi == []:
             return
-        # permute ar
-        newar = ar[:]
-        for i , v in enumerate(vi):
-            newar[i] = ar[v] 
-        for i in range(len(ar)):
-            ar[i] = newar[i]            
-        # replace each index j by iv[j] in R
-        iv = invperm(vi)                
-        for O in R:            
+        # permute ar with a single fancy-indexing gather
+        arr = np.asarray(ar, dtype=np.float64)[np.asarray(vi, dtype=np.int64)]
+        ar[:] = [tuple(x) for x in arr]
+        # replace each index j by iv[j] in R, remapping a whole chain at once
+        iv = invperm(vi)
+        for O in R:
             for C in O:
-                for k in range(len(C)):                
-                    C[k] = (C[k][0] , (chI(C[k][1][0], index, iv), chI(C[k][1][1], index, iv), chI(C[k][1][2], index, iv)))                
-        return 
-    
+                tri = np.array([T for _ , T in C], dtype=np.int64) # (len(C),3,3)
+                tri[:, :, index] = iv[tri[:, :, index]]
+                lst = tri.tolist()
+                for k in range(len(C)):
+                    t = lst[k]
+                    C[k] = (C[k][0] , (tuple(t[0]), tuple(t[1]), tuple(t[2])))
+        return
+
     def trim(ar, R, index, arname):
         next = 0
         for O in R:
@@ -561,8 +720,13 @@ def reorderVNTarrays(vertice, texture, normal, R):
 # In[ ]:
 
 
-def arraytoString(array):
-    return "{\n" + ("\n".join( [ "{" + ",".join([str(i) for i in u]) + "}," for u in array] )).rstrip(",") + "\n};\n"
+# write a C initializer block for a list of n-tuples, one prebuilt format
+# string per row instead of per-component str() + join
+def writeArray(f, array):
+    fmt = "{{" + ",".join(["{}"] * len(array[0])) + "}},\n"
+    f.write("{\n")
+    f.writelines(fmt.format(*u) for u in array)
+    f.write("};\n")
 
 
 # In[ ]:
@@ -600,7 +764,9 @@ def savemodel(vertice, texture, normal, R, modelname, texturenames, tag, color,
             totKB += 2*(1 + (2 + len(C))*elem)   
     totKB //= 1024
     
-    with open(modelname + ".h", "w") as f:
+    # assemble the whole file in memory and write it out in one go: the many
+    # small writes below are then just string appends
+    with io.StringIO() as f:
         f.write(f'// 3D model [{modelname}]\n')
         f.write(f'//\n')
         f.write(f'// - vertices   : {len(vertice)}\n')
@@ -638,17 +804,17 @@ def savemodel(vertice, texture, normal, R, modelname, texturenames, tag, color,
  
         f.write(f"\n\n// vertex array: {(len(vertice)*12)//1024}kb.\n")
         f.write(f"const {NAMESPACE}::fVec3 {name_vertice}[{len(vertice)}] PROGMEM = ")
-        f.write(arraytoString(vertice))
+        writeArray(f, vertice)
     
         if len(texture) > 0:
             f.write(f"\n\n// texture array: {(len(texture)*8)//1024}kb.\n")
             f.write(f"const {NAMESPACE}::fVec2 {name_texture}[{len(texture)}] PROGMEM = ")
-            f.write(arraytoString(texture))
+            writeArray(f, texture)
             
         if len(normal) > 0:
             f.write(f"\n\n// normal array: {(len(normal)*12)//1024}kb.\n")
             f.write(f"const {NAMESPACE}::fVec3 {name_normal}[{len(normal)}] PROGMEM = ")
-            f.write(arraytoString(normal))
+            writeArray(f, normal)
             
         f.write("\n");
             
@@ -657,51 +823,65 @@ def savemodel(vertice, texture, normal, R, modelname, texturenames, tag, color,
             elem +=1
         if len(normal) > 0:
             elem +=1
-           
+
+        # texture/normal presence is uniform across the model (checked at load
+        # time) so pick one specialized writer up front instead of testing the
+        # indexes of every element. Elements are buffered and flushed in one
+        # write per face array.
+        buf = []
         nbw = 0
-        def writeelem(el):
-                nonlocal f
+        if elem == 3:
+            def writeelem(el):
                 nonlocal nbw
-                nbw+=1
-                f.write(f"{el[0]},")
-                if el[1] >= 0:
-                    f.write(f"{el[1]},")
-                    nbw+=1
-                if el[2] >= 0:
-                    f.write(f"{el[2]},")
-                    nbw+=1                    
-                f.write(" ")
-            
-        for mnb, O in enumerate(R):            
+                nbw += 3
+                buf.append(f"{el[0]},{el[1]},{el[2]}, ")
+        elif len(texture) > 0:
+            def writeelem(el):
+                nonlocal nbw
+                nbw += 2
+                buf.append(f"{el[0]},{el[1]}, ")
+        elif len(normal) > 0:
+            def writeelem(el):
+                nonlocal nbw
+                nbw += 2
+                buf.append(f"{el[0]},{el[2]}, ")
+        else:
+            def writeelem(el):
+                nonlocal nbw
+                nbw += 1
+                buf.append(f"{el[0]}, ")
+
+        for mnb, O in enumerate(R):
             name = modelname
             if len(R) > 1:
                 name += "_" + str(mnb + 1)
             name += "_face"
             nbw = 0
-            tl = 1            
-            for C in O:                                
-                tl +=  1 + (2 + len(C))*elem   
-            f.write(f"\n// face array: {(tl*2)//1024}kb.\n")
-            f.write(f"const uint16_t {name}[{tl}] PROGMEM = {{\n")
-            for nc, C in enumerate(O):                
-                f.write(f"{len(C)}, // chain {nc}\n")
+            tl = 1
+            for C in O:
+                tl +=  1 + (2 + len(C))*elem
+            buf = [f"\n// face array: {(tl*2)//1024}kb.\n",
+                   f"const uint16_t {name}[{tl}] PROGMEM = {{\n"]
+            for nc, C in enumerate(O):
+                buf.append(f"{len(C)}, // chain {nc}\n")
                 nbw+=1
                 writeelem(C[0][1][0])
                 writeelem(C[0][1][1])
                 writeelem(C[0][1][2])
-                f.write("\n")
-                
+                buf.append("\n")
+
                 nl = 0
                 for L in C[1:]:
                     writeelem( (L[1][2][0] + (32768*L[0]) , L[1][2][1] , L[1][2][2]) )
                     nl +=1
                     if (nl == 16):
-                        f.write("\n")
-                        nl = 0  
+                        buf.append("\n")
+                        nl = 0
                 if nl!=0:
-                    f.write("\n")
-                    
-            f.write("\n 0};\n\n")
+                    buf.append("\n")
+
+            buf.append("\n 0};\n\n")
+            f.write("".join(buf))
             nbw +=1
             if nbw != tl:
                 error("savemodel() wrong count !")
@@ -773,7 +953,10 @@ const {NAMESPACE}::Mesh3D<{NAMESPACE}::RGB565> {name} PROGMEM =
     
     
     """)
-      
+
+        with open(modelname + ".h", "w") as out:
+            out.write(f.getvalue())
+
 
 
 # In[ ]:
@@ -831,10 +1014,11 @@ vertice, texture, normal, obj, tag = loadObjFile(filename)
 # create normals if needed and normalize them.
 normal = fixNormals(vertice, normal, obj)
 
-for i,N in enumerate(normal):
-    n2 = N[0]*N[0] + N[1]*N[1] + N[2]*N[2]
-    if (n2 < 0.9999) or (n2 > 1.0001):
-        print(f"error normal {N} (index {i}) with norm2 ={n2}")
+if len(normal) > 0:
+    N = np.asarray(normal, dtype=np.float64)
+    n2 = (N*N).sum(1)
+    for i in np.where((n2 < 0.9999) | (n2 > 1.0001))[0]:
+        print(f"error normal {normal[i]} (index {i}) with norm2 ={n2[i]}")
 
 # reorder triangles to maximize chaining
 print("")
@@ -7,53 +7,160 @@
 import PIL
 from PIL import Image
 import numpy as np
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from numba import njit, prange
+    has_numba = True
+except ImportError:
+    has_numba = False
 
 
 # In[ ]:
 
 
-def RGB565(rgb):
-    R = int((rgb[0] + 4)*31.0/255.0) << 11
-    G = int((rgb[1] + 2)*63.0/255.0) << 5
-    B = int((rgb[2] + 4)*31.0/255.0) 
-    return hex(R + G + B)
+# quantization tables: the 5/6 bit value of each of the 256 channel values,
+# built once with the exact formula (x // 255 as (x*32897) >> 23)
+_c = np.arange(256, dtype=np.uint32)
+LUT5 = (((_c + 4)*31*32897) >> 23).astype(np.uint16)
+LUT6 = (((_c + 2)*63*32897) >> 23).astype(np.uint16)
+
+
+if has_numba:
+    # scalar kernel compiled to native (and parallel) code, same formula as
+    # the numpy expression below
+    @njit(parallel=True, cache=True)
+    def _rgb565_kernel(ar, out):
+        H, W = ar.shape[0], ar.shape[1]
+        for y in prange(H):
+            for x in range(W):
+                out[y, x] = (LUT5[ar[y, x, 0]] << 11) | (LUT6[ar[y, x, 1]] << 5) | LUT5[ar[y, x, 2]]
+
+
+def RGB565array(ar):
+    if has_numba:
+        out = np.empty(ar.shape[:2], dtype=np.uint16)
+        _rgb565_kernel(ar, out)
+        return out
+    # pack every pixel at once: quantization is a table lookup per channel
+    # (the tables hold the same values as the old per-pixel float formula).
+    # each channel is compacted to a contiguous plane first so the gather
+    # reads packed bytes instead of stride-3 interleaved ones
+    R = np.ascontiguousarray(ar[:, :, 0])
+    G = np.ascontiguousarray(ar[:, :, 1])
+    B = np.ascontiguousarray(ar[:, :, 2])
+    return (LUT5[R] << np.uint16(11)) | (LUT6[G] << np.uint16(5)) | LUT5[B]
 
 
 # In[ ]:
 
 
-def createTexture(im, name):
+def createTexture(im, name, embed=False, savebin=False):
     NAMESPACE = "tgx"
-    ar = np.asarray(im)
-    with open(name + "_texture.h", "w") as f:   
-        f.write('//\n');
-        f.write(f'// texture [{name}]\n');
-        f.write('//\n');
-        f.write('#pragma once\n\n');
-        f.write('#include <tgx.h>\n\n');
-        f.write(f'const uint16_t {name}_texture_data[{im.width}*{im.height}] PROGMEM = {{\n');
-        i = 0
-        for y in range(im.height):
-            for x in range(im.width):
-                f.write(RGB565(ar[im.height - 1 - y, x]))
-                if y*x != ((im.width-1)*(im.height-1)):
-                    f.write(", ")
-                i += 1
-                if i == 16:
-                    f.write("\n")
-                    i = 0;
-        f.write('};\n\n')
-        f.write(f'const {NAMESPACE}::Image<{NAMESPACE}::RGB565> {name}_texture((void*){name}_texture_data, {im.width}, {im.height});')                    
-        f.write(f'\n\n/** end of file {name}_texture.h */\n\n');
-    print(f"\nTexture file [{name}_texture.h] created.\n\n")
+    # Pillow converts to 3 channels and flips vertically in C, so the array
+    # comes out already oriented, contiguous and 3 bytes per pixel; going
+    # through tobytes/frombuffer costs a single copy of the raw pixels
+    # (read-only, which is all the packing needs)
+    im = im.convert("RGB").transpose(Image.FLIP_TOP_BOTTOM)
+    ar = np.frombuffer(im.tobytes(), np.uint8).reshape(im.height, im.width, 3)
+
+    # rows per tile: pack and format a block small enough to stay in cache
+    # between the quantization pass and the text formatting pass
+    TILE = 256
+
+    # a full 16-value output line, precomputed once
+    LINE_FMT = "0x%04x, " * 16 + "\n"
+
+    # format one packed tile. a trailing comma is valid in a C initializer
+    # list, so no special case for the last value (the old y*x test also
+    # emitted malformed files for 1 pixel wide/tall images)
+    def formatTile(out, idx):
+        n = out.size
+        if (idx % 16 == 0) and (n % 16 == 0):
+            # aligned case (any width multiple of 16, e.g. power of two
+            # textures at least 16 wide): one template substitution per
+            # tile, no per-value wrap test
+            return (LINE_FMT * (n // 16)) % tuple(out.ravel())
+        # one C call renders all the hex digits (big-endian so the digits
+        # of each value come out in order); python only slices and joins
+        hs = out.astype('>u2').tobytes().hex()
+        vals = ["0x" + hs[i:i+4] for i in range(0, len(hs), 4)]
+        return "".join((s + ", \n") if ((idx + i) % 16 == 0) else (s + ", ")
+                       for i, s in enumerate(vals, 1))
+
+    if embed:
+        # the pixels go to a raw little-endian .bin sibling pulled in with
+        # C23 #embed: no hex text to generate (or to parse at compile time)
+        head = ('//\n'
+                f'// texture [{name}]\n'
+                '//\n'
+                '#pragma once\n\n'
+                '#include <tgx.h>\n\n'
+                f'// raw little-endian RGB565 pixels from [{name}_texture.bin]\n'
+                f'alignas(2) const uint8_t {name}_texture_data[{im.width}*{im.height}*2] PROGMEM = {{\n'
+                f'#embed "{name}_texture.bin"\n')
+    else:
+        head = ('//\n'
+                f'// texture [{name}]\n'
+                '//\n'
+                '#pragma once\n\n'
+                '#include <tgx.h>\n\n'
+                f'const uint16_t {name}_texture_data[{im.width}*{im.height}] PROGMEM = {{\n')
+    foot = ('};\n\n'
+            f'const {NAMESPACE}::Image<{NAMESPACE}::RGB565> {name}_texture((void*){name}_texture_data, {im.width}, {im.height});'
+            f'\n\n/** end of file {name}_texture.h */\n\n')
+
+    # binary mode with a large buffer: the payload is encoded once and goes
+    # out without passing through the text layer
+    with open(name + "_texture.h", "wb", buffering=1<<20) as f:
+        f.write(head.encode())
+        if embed:
+            with open(name + "_texture.bin", "wb", buffering=1<<20) as fb:
+                for y0 in range(0, ar.shape[0], TILE):
+                    fb.write(RGB565array(ar[y0:y0+TILE]).astype('<u2').tobytes())
+        else:
+            W = ar.shape[1]
+            tiles = range(0, ar.shape[0], TILE)
+
+            def renderTile(y0):
+                return formatTile(RGB565array(ar[y0:y0+TILE]), y0*W)
+
+            if (not has_numba) and (ar.shape[0]*W >= (1 << 20)):
+                # big texture: the pack and the hex rendering release the
+                # GIL often enough for tiles to overlap with the writes.
+                # only used without numba, whose parallel kernel both covers
+                # the multi-core angle and is not reentrant from several
+                # python threads
+                with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+                    for text in ex.map(renderTile, tiles):
+                        f.write(text.encode())
+            else:
+                for y0 in tiles:
+                    f.write(renderTile(y0).encode())
+        f.write(foot.encode())
+    if savebin and (not embed):
+        # raw little-endian dump next to the header, one C-level write per
+        # tile, for toolchains that link binary blobs directly
+        with open(name + "_texture.bin", "wb", buffering=1<<20) as fb:
+            for y0 in range(0, ar.shape[0], TILE):
+                fb.write(RGB565array(ar[y0:y0+TILE]).astype('<u2').tobytes())
+
+    if embed or savebin:
+        print(f"\nTexture files [{name}_texture.h] and [{name}_texture.bin] created.\n\n")
+    else:
+        print(f"\nTexture file [{name}_texture.h] created.\n\n")
 
 
 # In[ ]:
 
 
 def testPow2(n):
-    return (n & (n-1) == 0) and n != 0
+    # n & (n-1) clears the lowest set bit: zero iff n is a power of two.
+    # the old form n & (n-1) == 0 parsed as n & ((n-1) == 0) and was wrong
+    # for every input except 1
+    return n > 0 and (n & (n - 1)) == 0
 
 
 # In[ ]:
@@ -95,12 +202,22 @@ if not testPow2(h):
     print("!!!! the image height is not a power of two: image cannot be used for texture mapping (but it can still be used as an image) !!!!")
 
 if (w != image.width) or (h != image.height):
-    image = image.resize((w,h),Image.BICUBIC)
+    # resample in RGB (faster than the palette/RGBA paths) and with LANCZOS,
+    # which downsamples textures better than BICUBIC at similar cost
+    image = image.convert("RGB").resize((w,h),Image.LANCZOS)
 
 
 name = input(f"Name of the texture ? ")
 
-createTexture(image, name)
+ans = input("Embed the pixels as a raw .bin sibling (C23 #embed) instead of a hex array (y/N) ? ")
+embed = len(ans) > 0 and (ans.lower())[0] == "y"
+
+savebin = False
+if not embed:
+    ans = input("Also save the raw pixels to a .bin sibling (y/N) ? ")
+    savebin = len(ans) > 0 and (ans.lower())[0] == "y"
+
+createTexture(image, name, embed, savebin)
 
 
 # In[ ]: